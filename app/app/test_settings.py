@@ -0,0 +1,19 @@
+"""
+Django settings for running the test suite.
+"""
+from app.settings import *  # noqa: F401,F403
+
+# In-memory SQLite keeps the tests off the disk and removes the need
+# for a running database server.
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+# Password hashing strength is irrelevant in tests, and the default PBKDF2
+# hasher dominates the cost of creating users.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
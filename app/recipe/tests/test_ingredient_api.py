@@ -3,7 +3,7 @@ Tests for the ingredients API.
 """
 from decimal import Decimal
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -15,11 +15,15 @@ from core.models import Ingredient, Recipe
 from recipe.serializers import IngredientSerializer
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+# Template for the detail URL, so reverse() is resolved only once.
+INGREDIENT_DETAIL_URL = reverse('recipe:ingredient-detail', args=[0]).replace(
+    '/0/', '/{}/')
+PRICE_2_54 = Decimal('2.54')
 
 
 def detail_url(ingredient_id):
     """Create and return a ingredient detail url."""
-    return reverse('recipe:ingredient-detail', args=[ingredient_id])
+    return INGREDIENT_DETAIL_URL.format(ingredient_id)
 
 
 def create_user(email='user@exampl.com', pwd='password123'):
@@ -27,11 +31,16 @@ def create_user(email='user@exampl.com', pwd='password123'):
     return get_user_model().objects.create_user(email, pwd)  # type: ignore
 
 
+def create_ingredients(user, names):
+    """Create ingredients for user in a single query."""
+    Ingredient.objects.bulk_create(
+        [Ingredient(user=user, name=name) for name in names])
+
+
 class PublicIngredientsApiTests(TestCase):
     """Tests unauthenticated API requests."""
 
-    def setUp(self):
-        self.client = APIClient()
+    client_class = APIClient
 
     def test_auth_required(self):
         """Test auth required to call API."""
@@ -39,19 +48,24 @@ class PublicIngredientsApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
 class PrivateIngredirentsAPITests(TestCase):
     """Tests authenticated tags API requests."""
 
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+
     def setUp(self):
-        self.client = APIClient()
-        self.user = create_user()
         self.client.force_authenticate(self.user)
 
     def test_retrieve_ingredients(self):
         """Test retrieving a list of ingredients."""
 
-        Ingredient.objects.create(user=self.user, name='Ingredient1')
-        Ingredient.objects.create(user=self.user, name='Ingredient2')
+        create_ingredients(self.user, ['Ingredient1', 'Ingredient2'])
         res = self.client.get(INGREDIENTS_URL)
 
         ingredients = Ingredient.objects.all().order_by('-name')
@@ -80,10 +94,9 @@ class PrivateIngredirentsAPITests(TestCase):
         url = detail_url(ingredient.id)  # type: ignore
         res = self.client.patch(url, payload)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        ingredient.refresh_from_db()
-
+        ingredient.refresh_from_db(fields=['name', 'user'])
         self.assertEqual(ingredient.name, payload['name'])
-        self.assertEqual(ingredient.user, self.user)
+        self.assertEqual(ingredient.user_id, self.user.id)  # type: ignore
 
     def test_delete_ingredient(self):
         """Test deleting the ingredient."""
@@ -104,7 +117,7 @@ class PrivateIngredirentsAPITests(TestCase):
             user=self.user,
             title='Some recipe',
             time_minutes=5,
-            price=Decimal('2.54'),
+            price=PRICE_2_54,
         )
         recipe.ingredients.add(ing1)
 
@@ -123,17 +136,16 @@ class PrivateIngredirentsAPITests(TestCase):
         recipe1 = Recipe.objects.create(
             title='Recipe1',
             time_minutes=20,
-            price=Decimal('2.54'),
+            price=PRICE_2_54,
             user=self.user,
         )
         recipe2 = Recipe.objects.create(
             title='Recipe2',
             time_minutes=20,
-            price=Decimal('2.54'),
+            price=PRICE_2_54,
             user=self.user,
         )
-        recipe1.ingredients.add(ing)
-        recipe2.ingredients.add(ing)
+        ing.recipe_set.add(recipe1, recipe2)  # type: ignore
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
@@ -2,13 +2,15 @@
 Tests for recipe APIs.
 """
 from decimal import Decimal
-import tempfile
+import io
 import os
+import shutil
+import tempfile
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
@@ -21,16 +23,24 @@ from recipe.serializers import (
 )
 
 RECIPES_URL = reverse('recipe:recipe-list')
+# Templates for the URLs with an id, so reverse() is resolved only once.
+RECIPE_DETAIL_URL = reverse('recipe:recipe-detail', args=[0]).replace(
+    '/0/', '/{}/')
+IMAGE_UPLOAD_URL = reverse('recipe:recipe-upload-image', args=[0]).replace(
+    '/0/', '/{}/')
+PRICE_5_25 = Decimal('5.25')
+PRICE_5_99 = Decimal('5.99')
+PRICE_2_50 = Decimal('2.50')
 
 
 def detail_url(recipe_id):
     """Create and return a recipe detail URL."""
-    return reverse('recipe:recipe-detail', args=[recipe_id])
+    return RECIPE_DETAIL_URL.format(recipe_id)
 
 
 def image_upload_url(recipe_id):
     """Create and return an image upload URL."""
-    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+    return IMAGE_UPLOAD_URL.format(recipe_id)
 
 
 def create_recipe(user, **params):
@@ -38,7 +48,7 @@ def create_recipe(user, **params):
     defaults = {
         'title': 'Simple recipe title.',
         'time_minutes': 22,
-        'price': Decimal('5.25'),
+        'price': PRICE_5_25,
         'description': 'Sample description',
         'link': 'http://example.com/recipe.pdf',
     }
@@ -53,11 +63,21 @@ def create_user(**params):
     return get_user_model().objects.create_user(**params)  # type: ignore
 
 
+def create_image_bytes():
+    """Create and return the content of a simple JPEG image."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (10, 10)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+# Encoded once and reused by the image upload tests.
+IMAGE_BYTES = create_image_bytes()
+
+
 class PublicRecipeAPITests(TestCase):
     """Tests for unautheticated API requests."""
 
-    def setUp(self):
-        self.client = APIClient()
+    client_class = APIClient
 
     def test_auth_required(self):
         """Test auth required to call API."""
@@ -65,12 +85,18 @@ class PublicRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
 class PrivateRecipeAPITests(TestCase):
     """Tests authenticated API requests."""
 
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(email='user@example.com', password='testpas14')
+
     def setUp(self):
-        self.client = APIClient()
-        self.user = create_user(email='user@example.com', password='testpas14')
         self.client.force_authenticate(self.user)
 
     def test_retrieve_recipies(self):
@@ -78,7 +104,9 @@ class PrivateRecipeAPITests(TestCase):
         create_recipe(user=self.user)
         create_recipe(user=self.user)
 
-        res = self.client.get(RECIPES_URL)
+        # Recipes, tags and ingredients are fetched with one query each.
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
 
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
@@ -92,11 +120,14 @@ class PrivateRecipeAPITests(TestCase):
                                  password='otherpassword1234')
 
         create_recipe(user=other_user)
+        # Two own recipes, so a missing prefetch shows up in the query count.
+        create_recipe(user=self.user)
         create_recipe(user=self.user)
 
-        res = self.client.get(RECIPES_URL)
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
 
-        recipes = Recipe.objects.filter(user=self.user)
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)  #type: ignore
@@ -116,15 +147,16 @@ class PrivateRecipeAPITests(TestCase):
         payload = {
             'title': 'Simple recipe',
             'time_minutes': 30,
-            'price': Decimal('5.99'),
+            'price': PRICE_5_99,
         }
         res = self.client.post(RECIPES_URL, payload)  # /api/recipes/recipe
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipe = Recipe.objects.get(id=res.data['id'])  # type: ignore
+        recipe = Recipe.objects.values(*payload, 'user_id').get(
+            id=res.data['id'])  # type: ignore
         for k, v in payload.items():
-            self.assertEqual(getattr(recipe, k), v)
-        self.assertEqual(recipe.user, self.user)
+            self.assertEqual(recipe[k], v)
+        self.assertEqual(recipe['user_id'], self.user.id)
 
     def test_partial_update(self):
         """Test partial uptade of a recipe."""
@@ -138,10 +170,10 @@ class PrivateRecipeAPITests(TestCase):
         url = detail_url(recipe.id)  # type: ignore
         res = self.client.patch(url, payload)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        recipe.refresh_from_db()
+        recipe.refresh_from_db(fields=['title', 'link', 'user'])
         self.assertEqual(recipe.title, payload['title'])
         self.assertEqual(recipe.link, original_link)
-        self.assertEqual(recipe.user, self.user)
+        self.assertEqual(recipe.user_id, self.user.id)  # type: ignore
 
     def test_full_update(self):
         """Test full update of recipe."""
@@ -156,15 +188,15 @@ class PrivateRecipeAPITests(TestCase):
             'link': 'https://example.com/new-recipe.pdf',
             'description': 'New recipe description',
             'time_minutes': 10,
-            'price': Decimal('2.50'),
+            'price': PRICE_2_50,
         }
         url = detail_url(recipe.id)  # type: ignore
         res = self.client.put(url, payload)  # put for full update
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        recipe.refresh_from_db()
+        recipe.refresh_from_db(fields=[*payload, 'user'])
         for k, v in payload.items():
             self.assertEqual(getattr(recipe, k), v)
-        self.assertEqual(recipe.user, self.user)
+        self.assertEqual(recipe.user_id, self.user.id)  # type: ignore
 
     def test_update_user_returns_error(self):
         """Test changing the recipe user results in an error."""
@@ -204,7 +236,7 @@ class PrivateRecipeAPITests(TestCase):
         payload = {
             'title': 'Simple recipe title',
             'time_minutes': 20,
-            'price': Decimal('2.50'),
+            'price': PRICE_2_50,
             'tags': [{
                 'name': 'Thai'
             }, {
@@ -215,16 +247,17 @@ class PrivateRecipeAPITests(TestCase):
         res = self.client.post(RECIPES_URL, payload, format='json')
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipes = Recipe.objects.filter(user=self.user)
-        self.assertEqual(recipes.count(), 1)
+        recipes = Recipe.objects.filter(
+            user=self.user).prefetch_related('tags')
+        self.assertEqual(len(recipes), 1)
         recipe = recipes[0]
-        self.assertEqual(recipe.tags.count(), 2)  # type: ignore
-        for tag in payload['tags']:
-            exist = Tag.objects.filter(
-                user=self.user,
-                name=tag['name'],
-            ).exists()
-            self.assertTrue(exist)
+        self.assertEqual(len(recipe.tags.all()), 2)  # type: ignore
+        names = [tag['name'] for tag in payload['tags']]
+        tags = Tag.objects.filter(
+            user=self.user,
+            name__in=names,
+        ).values_list('name', flat=True)
+        self.assertEqual(set(tags), set(names))
 
     def test_create_recipe_with_existing_tag(self):
         """Test creating a recipe with existing tag."""
@@ -232,7 +265,7 @@ class PrivateRecipeAPITests(TestCase):
         payload = {
             'title': 'Simple recipe title',
             'time_minutes': 20,
-            'price': Decimal('2.50'),
+            'price': PRICE_2_50,
             'tags': [{
                 'name': 'Thai'
             }, {
@@ -242,17 +275,18 @@ class PrivateRecipeAPITests(TestCase):
         res = self.client.post(RECIPES_URL, payload, format='json')
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipes = Recipe.objects.filter(user=self.user)
-        self.assertEqual(recipes.count(), 1)
+        recipes = Recipe.objects.filter(
+            user=self.user).prefetch_related('tags')
+        self.assertEqual(len(recipes), 1)
         recipe = recipes[0]
-        self.assertEqual(recipe.tags.count(), 2)  # type: ignore
+        self.assertEqual(len(recipe.tags.all()), 2)  # type: ignore
         self.assertIn(tag, recipe.tags.all())  # type: ignore
-        for tag in payload['tags']:
-            exist = Tag.objects.filter(
-                user=self.user,
-                name=tag['name'],
-            ).exists()
-            self.assertTrue(exist)
+        names = [tag['name'] for tag in payload['tags']]
+        tags = Tag.objects.filter(
+            user=self.user,
+            name__in=names,
+        ).values_list('name', flat=True)
+        self.assertEqual(set(tags), set(names))
 
     def test_create_tag_on_update(self):
         """Test creating a new tag on updating a recipe."""
@@ -299,7 +333,7 @@ class PrivateRecipeAPITests(TestCase):
         payload = {
             'title': 'Simple recipe title',
             'time_minutes': 20,
-            'price': Decimal('2.50'),
+            'price': PRICE_2_50,
             'ingredients': [{
                 'name': 'Salt'
             }, {
@@ -310,16 +344,17 @@ class PrivateRecipeAPITests(TestCase):
         res = self.client.post(RECIPES_URL, payload, format='json')
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipes = Recipe.objects.filter(user=self.user)
-        self.assertEqual(recipes.count(), 1)
+        recipes = Recipe.objects.filter(
+            user=self.user).prefetch_related('ingredients')
+        self.assertEqual(len(recipes), 1)
         recipe = recipes[0]
-        self.assertEqual(recipe.ingredients.count(), 2)  # type: ignore
-        for ingredient in payload['ingredients']:
-            exist = Ingredient.objects.filter(
-                user=self.user,
-                name=ingredient['name'],
-            ).exists()
-            self.assertTrue(exist)
+        self.assertEqual(len(recipe.ingredients.all()), 2)  # type: ignore
+        names = [ingredient['name'] for ingredient in payload['ingredients']]
+        ingredients = Ingredient.objects.filter(
+            user=self.user,
+            name__in=names,
+        ).values_list('name', flat=True)
+        self.assertEqual(set(ingredients), set(names))
 
     def test_create_recipe_with_existing_ingredient(self):
         """Test creating a new recipe with exisiting ingredient."""
@@ -327,7 +362,7 @@ class PrivateRecipeAPITests(TestCase):
         payload = {
             'title': 'Simple recipe title',
             'time_minutes': 20,
-            'price': Decimal('2.50'),
+            'price': PRICE_2_50,
             'ingredients': [{
                 'name': 'Lemon'
             }, {
@@ -337,17 +372,18 @@ class PrivateRecipeAPITests(TestCase):
         res = self.client.post(RECIPES_URL, payload, format='json')
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipes = Recipe.objects.filter(user=self.user)
-        self.assertEqual(recipes.count(), 1)
+        recipes = Recipe.objects.filter(
+            user=self.user).prefetch_related('ingredients')
+        self.assertEqual(len(recipes), 1)
         recipe = recipes[0]
-        self.assertEqual(recipe.ingredients.count(), 2)  # type: ignore
+        self.assertEqual(len(recipe.ingredients.all()), 2)  # type: ignore
         self.assertIn(ingredient, recipe.ingredients.all())  # type: ignore
-        for ingredient in payload['ingredients']:
-            exist = recipe.ingredients.filter(  # type: ignore
-                name=ingredient['name'],
-                user=self.user,
-            ).exists()
-            self.assertTrue(exist)
+        names = [ingredient['name'] for ingredient in payload['ingredients']]
+        ingredients = recipe.ingredients.filter(  # type: ignore
+            name__in=names,
+            user=self.user,
+        ).values_list('name', flat=True)
+        self.assertEqual(set(ingredients), set(names))
 
     def test_create_ingredient_on_update(self):
         """Test creating an ingredient when updating a recipe."""
@@ -394,20 +430,18 @@ class PrivateRecipeAPITests(TestCase):
         r2 = create_recipe(user=self.user, title='Recipe2')
         tag1 = Tag.objects.create(user=self.user, name='Tag1')
         tag2 = Tag.objects.create(user=self.user, name='Tag2')
-        r1.tags.add(tag1)
-        r2.tags.add(tag2)
-        r3 = create_recipe(user=self.user, title='Recipe3')
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=r1, tag=tag1),
+            Recipe.tags.through(recipe=r2, tag=tag2),
+        ])
+        create_recipe(user=self.user, title='Recipe3')
 
         params = {'tags': f'{tag1.id},{tag2.id}'}  # type: ignore
-        res = self.client.get(RECIPES_URL, params)
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL, params)
 
-        s1 = RecipeSerializer(r1)
-        s2 = RecipeSerializer(r2)
-        s3 = RecipeSerializer(r3)
-
-        self.assertIn(s1.data, res.data)  # type: ignore
-        self.assertIn(s2.data, res.data)  # type: ignore
-        self.assertNotIn(s3.data, res.data)  # type: ignore
+        ids = {recipe['id'] for recipe in res.data}  # type: ignore
+        self.assertEqual(ids, {r1.id, r2.id})  # type: ignore
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredients."""
@@ -415,46 +449,57 @@ class PrivateRecipeAPITests(TestCase):
         r2 = create_recipe(user=self.user, title='Recipe2')
         in1 = Ingredient.objects.create(user=self.user, name='Ingredient1')
         in2 = Ingredient.objects.create(user=self.user, name='Ingredient2')
-        r1.ingredients.add(in1)
-        r2.ingredients.add(in2)
-        r3 = create_recipe(user=self.user, title='Recipe3')
+        Recipe.ingredients.through.objects.bulk_create([
+            Recipe.ingredients.through(recipe=r1, ingredient=in1),
+            Recipe.ingredients.through(recipe=r2, ingredient=in2),
+        ])
+        create_recipe(user=self.user, title='Recipe3')
 
         params = {'ingredients': f'{in1.id},{in2.id}'}  # type: ignore
-        res = self.client.get(RECIPES_URL, params)
-
-        s1 = RecipeSerializer(r1)
-        s2 = RecipeSerializer(r2)
-        s3 = RecipeSerializer(r3)
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL, params)
 
-        self.assertIn(s1.data, res.data)  # type: ignore
-        self.assertIn(s2.data, res.data)  # type: ignore
-        self.assertNotIn(s3.data, res.data)  # type: ignore
+        ids = {recipe['id'] for recipe in res.data}  # type: ignore
+        self.assertEqual(ids, {r1.id, r2.id})  # type: ignore
 
 
 class ImageUploadTests(TestCase):
     """Tests for image upload API."""
 
-    def setUp(self):
-        self.client = APIClient()
-        self.user = get_user_model().objects.create(
+    client_class = APIClient
+
+    @classmethod
+    def setUpClass(cls):
+        # Uploads go to a throwaway directory removed after the class runs.
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(
             email='user@example.com',
             password='test12345',
         )
+
+    def setUp(self):
         self.client.force_authenticate(self.user)
         self.recipe = create_recipe(user=self.user)
 
-    def tearDown(self):
-        self.recipe.image.delete()
-
     def test_upload_image(self):
         """Test upload image to a recipe."""
         url = image_upload_url(self.recipe.id)  # type: ignore
-        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
-            img = Image.new('RGB', (10, 10))
-            img.save(image_file, format='JPEG')
-            image_file.seek(0)
-            payload = {'image': image_file}
-            res = self.client.post(url, payload, format='multipart')
+        image_file = io.BytesIO(IMAGE_BYTES)
+        image_file.name = 'image.jpg'
+        payload = {'image': image_file}
+        res = self.client.post(url, payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.recipe.refresh_from_db()
@@ -2,7 +2,7 @@
 Tests for the tags API.
 """
 from decimal import Decimal
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -14,11 +14,15 @@ from core.models import Tag, Recipe
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
+# Template for the detail URL, so reverse() is resolved only once.
+TAG_DETAIL_URL = reverse('recipe:tag-detail', args=[0]).replace(
+    '/0/', '/{}/')
+PRICE_2_54 = Decimal('2.54')
 
 
 def detail_url(tag_id):
     """Create and return a tag detail url."""
-    return reverse('recipe:tag-detail', args=[tag_id])
+    return TAG_DETAIL_URL.format(tag_id)
 
 
 def create_user(email='user@exampl.com', pwd='password123'):
@@ -26,11 +30,16 @@ def create_user(email='user@exampl.com', pwd='password123'):
     return get_user_model().objects.create_user(email, pwd)  # type: ignore
 
 
+def create_tags(user, names):
+    """Create tags for user in a single query."""
+    Tag.objects.bulk_create(
+        [Tag(user=user, name=name) for name in names])
+
+
 class PublicTagsApiTests(TestCase):
     """Tests unauthenticated API requests."""
 
-    def setUp(self):
-        self.client = APIClient()
+    client_class = APIClient
 
     def test_auth_required(self):
         """Test auth required to call API."""
@@ -38,40 +47,52 @@ class PublicTagsApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
 class PrivateTagsAPITests(TestCase):
     """Tests authenticated tags API requests."""
 
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+
     def setUp(self):
-        self.client = APIClient()
-        self.user = create_user()
         self.client.force_authenticate(self.user)
 
     def test_retrieve_tags(self):
         """Test retieving a list of tags."""
 
-        Tag.objects.create(user=self.user, name='Vegan')
-        Tag.objects.create(user=self.user, name='Dessert')
-        res = self.client.get(TAGS_URL)
+        create_tags(self.user, ['Vegan', 'Dessert'])
+        # Tags are listed with a single query, with no per-tag lookups.
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
-        tags = Tag.objects.all().order_by('-name')
-        serializer = TagSerializer(tags, many=True)
-
-        self.assertEqual(res.data, serializer.data)  # type: ignore
+        # bulk_create does not set ids on every backend, so look them up.
+        ids = dict(Tag.objects.values_list('name', 'id'))
+        expected = [
+            {'id': ids['Vegan'], 'name': 'Vegan'},
+            {'id': ids['Dessert'], 'name': 'Dessert'},
+        ]
+        self.assertEqual(res.data, expected)  # type: ignore
 
     def test_tags_list_limited_to_user(self):
         """Test list of tags is limited th authenticated user."""
         other_user = create_user(email='other@example.com',
                                  pwd='otherpassword1234')
-        Tag.objects.create(user=other_user, name='Vegan')
-        Tag.objects.create(user=self.user, name='Dessert')
+        Tag.objects.bulk_create([
+            Tag(user=other_user, name='Vegan'),
+            Tag(user=self.user, name='Dessert'),
+        ])
 
         res = self.client.get(TAGS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        tags = Tag.objects.filter(user=self.user)
-        serializer = TagSerializer(tags, many=True)
-        self.assertEqual(res.data, serializer.data)  # type: ignore
+        tag_id = Tag.objects.values_list('id', flat=True).get(user=self.user)
+        expected = [{'id': tag_id, 'name': 'Dessert'}]
+        self.assertEqual(res.data, expected)  # type: ignore
 
     def test_update_tag(self):
         """Test updating the tag."""
@@ -79,23 +100,28 @@ class PrivateTagsAPITests(TestCase):
         payload = {'name': 'Dessert'}
 
         url = detail_url(tag.id)  # type: ignore
-        res = self.client.patch(url, payload)
+        # One query to fetch the tag and one to save it.
+        with self.assertNumQueries(2):
+            res = self.client.patch(url, payload)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        tag.refresh_from_db()
-
-        self.assertEqual(tag.name, payload['name'])  # type: ignore
-        self.assertEqual(tag.user, self.user)
+        self.assertEqual(res.data['name'], payload['name'])  # type: ignore
+        name, user_id = Tag.objects.values_list('name', 'user_id').get(
+            pk=tag.pk)
+        self.assertEqual(name, payload['name'])
+        self.assertEqual(user_id, self.user.id)  # type: ignore
 
     def test_delete_tag(self):
         """Test deleting the tag."""
         tag = Tag.objects.create(user=self.user, name='After dinner')
+        tag_id = tag.pk
 
-        url = detail_url(tag.id)  # type: ignore
-        res = self.client.delete(url)
+        url = detail_url(tag_id)
+        # Fetch the tag, then delete its recipe links and the tag itself.
+        with self.assertNumQueries(3):
+            res = self.client.delete(url)
 
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertFalse(
-            Tag.objects.filter(id=tag.id).exists())  # type: ignore
+        self.assertFalse(Tag.objects.filter(pk=tag_id).exists())
 
     def test_filter_tags_assigned_to_recipes(self):
         """Test listing tags by those assigned to recipes."""
@@ -105,7 +131,7 @@ class PrivateTagsAPITests(TestCase):
             user=self.user,
             title='Some recipe',
             time_minutes=5,
-            price=Decimal('2.54'),
+            price=PRICE_2_54,
         )
         recipe.tags.add(tag1)
 
@@ -124,17 +150,16 @@ class PrivateTagsAPITests(TestCase):
         recipe1 = Recipe.objects.create(
             title='Recipe1',
             time_minutes=20,
-            price=Decimal('2.54'),
+            price=PRICE_2_54,
             user=self.user,
         )
         recipe2 = Recipe.objects.create(
             title='Recipe2',
             time_minutes=20,
-            price=Decimal('2.54'),
+            price=PRICE_2_54,
             user=self.user,
         )
-        recipe1.tags.add(tag)
-        recipe2.tags.add(tag)
+        tag.recipe_set.add(recipe1, recipe2)  # type: ignore
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
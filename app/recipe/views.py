@@ -54,8 +54,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if ingredients:
             ingr_ids = self._params_to_ints(ingredients)
             queryset = queryset.filter(ingredients__id__in=ingr_ids)
-        return queryset.filter(
+        queryset = queryset.filter(
             user=self.request.user).order_by('-id').distinct()
+        if self.action == 'list':
+            # Avoid two queries per recipe for the nested tags and
+            # ingredients; single objects gain nothing from prefetching.
+            queryset = queryset.prefetch_related('tags', 'ingredients')
+        return queryset
         # return self.queryset.filter(user=self.request.user).order_by('-id')
 
     def get_serializer_class(self):